@@ -1,7 +1,10 @@
 import type {
+  Provider,
   ProviderScoreRequest,
   ProviderScoreResponse,
   ProviderSearchResponse,
+  SearchParams,
+  SuggestResponse,
 } from "../types/provider";
 
 const API_URL: string = import.meta.env.VITE_API_URL;
@@ -23,6 +26,81 @@ export async function fetchSearchResults(query: string) {
   return data;
 }
 
+// Search using the Server-Sent Events endpoint, calling onUpdate with the
+// partial response as parameters and result chunks arrive
+export async function streamSearchResults(
+  query: string,
+  onUpdate: (data: ProviderSearchResponse) => void,
+) {
+  const res = await fetch(`${API_URL}/api/search_providers/stream`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({ query }),
+  });
+
+  if (!res.ok || !res.body) {
+    throw new Error("Request failed");
+  }
+
+  let data: ProviderSearchResponse = {
+    success: true,
+    parsed_params: {} as SearchParams,
+    results: [],
+  };
+
+  const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = "";
+  let finished = false;
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+
+    buffer += value;
+    const messages = buffer.split("\n\n");
+    buffer = messages.pop() ?? "";
+
+    for (const message of messages) {
+      const event = message.match(/^event: (.*)$/m)?.[1];
+      const payload = JSON.parse(message.match(/^data: (.*)$/m)?.[1] ?? "{}");
+
+      if (event === "params") {
+        data = {
+          ...data,
+          parsed_params: payload.parsed_params,
+          hcpcs_desc: payload.hcpcs_desc,
+        };
+      } else if (event === "results") {
+        data = {
+          ...data,
+          results: [...data.results, ...(payload.results as Provider[])],
+        };
+      } else if (event === "done") {
+        data = { ...data, count: payload.count };
+        finished = true;
+      } else if (event === "error") {
+        data = { ...data, success: false, error: payload.error };
+        finished = true;
+      }
+      onUpdate(data);
+    }
+  }
+
+  // The stream ended without done or error, so the results are incomplete
+  if (!finished) {
+    data = {
+      ...data,
+      success: false,
+      error: "Connection lost before the search finished. Please try again",
+    };
+    onUpdate(data);
+  }
+
+  return data;
+}
+
 export async function scoreProviders(req: ProviderScoreRequest) {
   const res = await fetch(`${API_URL}/api/rank_providers`, {
     method: "POST",
@@ -39,3 +117,15 @@ export async function scoreProviders(req: ProviderScoreRequest) {
   const data: ProviderScoreResponse = await res.json();
   return data;
 }
+
+export async function fetchSuggestions(query: string) {
+  const params = new URLSearchParams({ q: query });
+  const res = await fetch(`${API_URL}/api/suggest?${params}`);
+
+  if (!res.ok) {
+    throw new Error("Request failed");
+  }
+
+  const data: SuggestResponse = await res.json();
+  return data;
+}
@@ -1,8 +1,13 @@
+import { useDeferredValue } from "react";
+import { useQuery } from "@tanstack/react-query";
 import Paper from "@mui/material/Paper";
 import InputBase from "@mui/material/InputBase";
 import Button from "@mui/material/Button";
+import Chip from "@mui/material/Chip";
 import SearchIcon from "@mui/icons-material/Search";
 
+import { fetchSuggestions } from "../api/providers";
+
 import styles from "./SearchInput.module.css";
 
 interface SearchInputProps {
@@ -10,13 +15,46 @@ interface SearchInputProps {
   placeholder: string;
   setUserQuery: React.Dispatch<React.SetStateAction<string>>;
   handleSubmit: (e: React.FormEvent) => void;
+  showSuggestions?: boolean;
+}
+
+// Replace the part of the query the server matched with the suggestion.
+// prefixStart indexes code points in suggestedQuery, which may be older than
+// query if the user kept typing. Returns null if the start no longer matches.
+function applySuggestion(
+  query: string,
+  suggestedQuery: string,
+  prefixStart: number,
+  label: string,
+) {
+  const head = Array.from(suggestedQuery).slice(0, prefixStart).join("");
+  if (!query.startsWith(head)) {
+    return null;
+  }
+  return head + label + " ";
 }
+
 export default function SearchInput({
   userQuery,
   placeholder,
   setUserQuery,
   handleSubmit,
+  showSuggestions = false,
 }: SearchInputProps) {
+  const deferredQuery = useDeferredValue(userQuery);
+  const { data: suggestData } = useQuery({
+    queryKey: ["suggest", deferredQuery],
+    queryFn: () => fetchSuggestions(deferredQuery),
+    enabled: showSuggestions && deferredQuery.trim().length >= 2,
+    staleTime: Infinity,
+  });
+  // suggestData is always for deferredQuery, which is what prefix_start indexes
+  const prefixStart = suggestData?.prefix_start ?? 0;
+  const suggestions =
+    showSuggestions && userQuery.trim().length >= 2 && suggestData
+      ? suggestData.suggestions
+      : [];
+
   return (
     <div className={styles.search}>
       <Paper
@@ -41,6 +79,29 @@ export default function SearchInput({
           Search
         </Button>
       </Paper>
+      {suggestions.length > 0 && (
+        <div className={styles.suggestions}>
+          {suggestions.map((s) => (
+            <Chip
+              key={`${s.type}-${s.label}`}
+              label={s.label}
+              size="small"
+              variant="outlined"
+              onClick={() => {
+                const query = applySuggestion(
+                  userQuery,
+                  deferredQuery,
+                  prefixStart,
+                  s.label,
+                );
+                if (query !== null) {
+                  setUserQuery(query);
+                }
+              }}
+            />
+          ))}
+        </div>
+      )}
     </div>
   );
 }
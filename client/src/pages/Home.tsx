@@ -8,7 +8,7 @@ import ScoreDialog from "../components/ScoreDialog";
 import PersonSearchIcon from "@mui/icons-material/PersonSearch";
 import styles from "./Home.module.css";
 
-import { fetchSearchResults, scoreProviders } from "../api/providers";
+import { scoreProviders, streamSearchResults } from "../api/providers";
 import {
   type ProviderScoreRequest,
   type ProviderScoreResponse,
@@ -23,7 +23,10 @@ export default function Home() {
   >(null);
 
   const searchMutation = useMutation({
-    mutationFn: (req: string) => fetchSearchResults(req),
+    mutationFn: (req: string) => streamSearchResults(req, setTableData),
+    onMutate: () => {
+      setTableData(null);
+    },
     onSuccess: (data) => {
       setTableData(data);
     },
@@ -84,6 +87,7 @@ export default function Home() {
               placeholder="Ex: I need a cardiologist who can do an ultrasound near downtown Chicago"
               setUserQuery={setSearchQuery}
               handleSubmit={handleSearchSubmit}
+              showSuggestions
             />
             <p className={styles.search_footer}>
               Describe what you're looking for in plain language
@@ -125,10 +129,13 @@ export default function Home() {
 
               <ProviderTable
                 tableData={tableData}
-                isLoading={isSearchPending || isScorePending}
+                isLoading={
+                  (isSearchPending && !tableData?.results.length) ||
+                  isScorePending
+                }
               />
 
-              {tableData?.success && (
+              {tableData?.success && !isSearchPending && (
                 <div className={styles.dialog}>
                   <p>Find the best providers for you</p>
                   <ScoreDialog
@@ -48,3 +48,15 @@ export interface ProviderScoreResponse {
   results: ScoredProvider[]
   error?: string;
 }
+
+export interface Suggestion {
+  type: "specialty" | "procedure" | "city" | "state" | "zipcode";
+  label: string;
+  count: number;
+}
+
+export interface SuggestResponse {
+  prefix: string;
+  prefix_start: number;
+  suggestions: Suggestion[];
+}
@@ -0,0 +1,11 @@
+-- Version of the currently loaded CMS data, used in search ETags (see
+-- src/http_cache.py). Alternatively set the DATA_VERSION environment variable.
+--
+-- The ingest must insert a new row once it has finished loading, e.g.
+--   INSERT INTO data_version (version) VALUES ('2025-release-1');
+-- Running instances pick it up within a few minutes.
+
+CREATE TABLE IF NOT EXISTS data_version (
+    version VARCHAR(64) NOT NULL PRIMARY KEY,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
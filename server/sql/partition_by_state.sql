@@ -0,0 +1,171 @@
+-- Partition providers and provider_services by state.
+--
+-- Every search filters on rndrng_prvdr_state_abrvtn (see _search_query in
+-- src/queries.py), so MySQL prunes it to a single partition and the working
+-- set for a state stays small enough to remain in the buffer pool.
+--
+-- MySQL requires the partitioning column in every unique key, so the primary
+-- keys are widened to include the state. provider_services gets its own copy of
+-- the provider's state so it can be partitioned the same way. Once this has been
+-- applied, set SERVICES_STATE_COLUMN=true so searches filter on it too.
+--
+-- With the wider key, searches group by (rndrng_npi, rndrng_prvdr_state_abrvtn)
+-- so ONLY_FULL_GROUP_BY still accepts p.* when a search spans several states.
+--
+-- Lookups by provider ID alone (get_provider_demographics, used by
+-- /api/rank_providers) can't be routed to a partition and probe every one.
+--
+-- Run during a maintenance window: each ALTER rebuilds the table.
+
+-- providers
+
+ALTER TABLE providers
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (rndrng_npi, rndrng_prvdr_state_abrvtn);
+
+ALTER TABLE providers
+    PARTITION BY LIST COLUMNS (rndrng_prvdr_state_abrvtn) (
+    PARTITION p_ak VALUES IN ('AK'),
+    PARTITION p_al VALUES IN ('AL'),
+    PARTITION p_ar VALUES IN ('AR'),
+    PARTITION p_az VALUES IN ('AZ'),
+    PARTITION p_ca VALUES IN ('CA'),
+    PARTITION p_co VALUES IN ('CO'),
+    PARTITION p_ct VALUES IN ('CT'),
+    PARTITION p_dc VALUES IN ('DC'),
+    PARTITION p_de VALUES IN ('DE'),
+    PARTITION p_fl VALUES IN ('FL'),
+    PARTITION p_ga VALUES IN ('GA'),
+    PARTITION p_hi VALUES IN ('HI'),
+    PARTITION p_ia VALUES IN ('IA'),
+    PARTITION p_id VALUES IN ('ID'),
+    PARTITION p_il VALUES IN ('IL'),
+    PARTITION p_in VALUES IN ('IN'),
+    PARTITION p_ks VALUES IN ('KS'),
+    PARTITION p_ky VALUES IN ('KY'),
+    PARTITION p_la VALUES IN ('LA'),
+    PARTITION p_ma VALUES IN ('MA'),
+    PARTITION p_md VALUES IN ('MD'),
+    PARTITION p_me VALUES IN ('ME'),
+    PARTITION p_mi VALUES IN ('MI'),
+    PARTITION p_mn VALUES IN ('MN'),
+    PARTITION p_mo VALUES IN ('MO'),
+    PARTITION p_ms VALUES IN ('MS'),
+    PARTITION p_mt VALUES IN ('MT'),
+    PARTITION p_nc VALUES IN ('NC'),
+    PARTITION p_nd VALUES IN ('ND'),
+    PARTITION p_ne VALUES IN ('NE'),
+    PARTITION p_nh VALUES IN ('NH'),
+    PARTITION p_nj VALUES IN ('NJ'),
+    PARTITION p_nm VALUES IN ('NM'),
+    PARTITION p_nv VALUES IN ('NV'),
+    PARTITION p_ny VALUES IN ('NY'),
+    PARTITION p_oh VALUES IN ('OH'),
+    PARTITION p_ok VALUES IN ('OK'),
+    PARTITION p_or VALUES IN ('OR'),
+    PARTITION p_pa VALUES IN ('PA'),
+    PARTITION p_ri VALUES IN ('RI'),
+    PARTITION p_sc VALUES IN ('SC'),
+    PARTITION p_sd VALUES IN ('SD'),
+    PARTITION p_tn VALUES IN ('TN'),
+    PARTITION p_tx VALUES IN ('TX'),
+    PARTITION p_ut VALUES IN ('UT'),
+    PARTITION p_va VALUES IN ('VA'),
+    PARTITION p_vt VALUES IN ('VT'),
+    PARTITION p_wa VALUES IN ('WA'),
+    PARTITION p_wi VALUES IN ('WI'),
+    PARTITION p_wv VALUES IN ('WV'),
+    PARTITION p_wy VALUES IN ('WY'),
+    -- Territories, military addresses and unknown/foreign locations
+    PARTITION p_other VALUES IN ('AA', 'AE', 'AP', 'AS', 'GU', 'MP', 'PR', 'VI', 'XX', 'ZZ')
+);
+
+-- provider_services
+
+-- The column has no default: the ingest MUST set it to the provider's state for
+-- every row it inserts. An insert that leaves it out fails rather than landing
+-- in the wrong partition, where the state filter on searches would hide it.
+ALTER TABLE provider_services
+    ADD COLUMN rndrng_prvdr_state_abrvtn CHAR(2) NULL;
+
+UPDATE provider_services s
+JOIN providers p
+    ON p.rndrng_npi = s.rndrng_npi
+SET s.rndrng_prvdr_state_abrvtn = p.rndrng_prvdr_state_abrvtn;
+
+ALTER TABLE provider_services
+    MODIFY COLUMN rndrng_prvdr_state_abrvtn CHAR(2) NOT NULL;
+
+-- Assumes the existing primary key is (rndrng_npi, hcpcs_cd, place_of_srvc);
+-- adjust to match the table before running
+ALTER TABLE provider_services
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (rndrng_npi, hcpcs_cd, place_of_srvc, rndrng_prvdr_state_abrvtn);
+
+ALTER TABLE provider_services
+    PARTITION BY LIST COLUMNS (rndrng_prvdr_state_abrvtn) (
+    PARTITION p_ak VALUES IN ('AK'),
+    PARTITION p_al VALUES IN ('AL'),
+    PARTITION p_ar VALUES IN ('AR'),
+    PARTITION p_az VALUES IN ('AZ'),
+    PARTITION p_ca VALUES IN ('CA'),
+    PARTITION p_co VALUES IN ('CO'),
+    PARTITION p_ct VALUES IN ('CT'),
+    PARTITION p_dc VALUES IN ('DC'),
+    PARTITION p_de VALUES IN ('DE'),
+    PARTITION p_fl VALUES IN ('FL'),
+    PARTITION p_ga VALUES IN ('GA'),
+    PARTITION p_hi VALUES IN ('HI'),
+    PARTITION p_ia VALUES IN ('IA'),
+    PARTITION p_id VALUES IN ('ID'),
+    PARTITION p_il VALUES IN ('IL'),
+    PARTITION p_in VALUES IN ('IN'),
+    PARTITION p_ks VALUES IN ('KS'),
+    PARTITION p_ky VALUES IN ('KY'),
+    PARTITION p_la VALUES IN ('LA'),
+    PARTITION p_ma VALUES IN ('MA'),
+    PARTITION p_md VALUES IN ('MD'),
+    PARTITION p_me VALUES IN ('ME'),
+    PARTITION p_mi VALUES IN ('MI'),
+    PARTITION p_mn VALUES IN ('MN'),
+    PARTITION p_mo VALUES IN ('MO'),
+    PARTITION p_ms VALUES IN ('MS'),
+    PARTITION p_mt VALUES IN ('MT'),
+    PARTITION p_nc VALUES IN ('NC'),
+    PARTITION p_nd VALUES IN ('ND'),
+    PARTITION p_ne VALUES IN ('NE'),
+    PARTITION p_nh VALUES IN ('NH'),
+    PARTITION p_nj VALUES IN ('NJ'),
+    PARTITION p_nm VALUES IN ('NM'),
+    PARTITION p_nv VALUES IN ('NV'),
+    PARTITION p_ny VALUES IN ('NY'),
+    PARTITION p_oh VALUES IN ('OH'),
+    PARTITION p_ok VALUES IN ('OK'),
+    PARTITION p_or VALUES IN ('OR'),
+    PARTITION p_pa VALUES IN ('PA'),
+    PARTITION p_ri VALUES IN ('RI'),
+    PARTITION p_sc VALUES IN ('SC'),
+    PARTITION p_sd VALUES IN ('SD'),
+    PARTITION p_tn VALUES IN ('TN'),
+    PARTITION p_tx VALUES IN ('TX'),
+    PARTITION p_ut VALUES IN ('UT'),
+    PARTITION p_va VALUES IN ('VA'),
+    PARTITION p_vt VALUES IN ('VT'),
+    PARTITION p_wa VALUES IN ('WA'),
+    PARTITION p_wi VALUES IN ('WI'),
+    PARTITION p_wv VALUES IN ('WV'),
+    PARTITION p_wy VALUES IN ('WY'),
+    -- Territories, military addresses and unknown/foreign locations
+    PARTITION p_other VALUES IN ('AA', 'AE', 'AP', 'AS', 'GU', 'MP', 'PR', 'VI', 'XX', 'ZZ')
+);
+
+-- Supporting indexes for the search filters within a partition
+
+CREATE INDEX idx_providers_state_city_type
+    ON providers (rndrng_prvdr_state_abrvtn, rndrng_prvdr_city, rndrng_prvdr_type);
+
+CREATE INDEX idx_providers_zip_type
+    ON providers (rndrng_prvdr_zip5, rndrng_prvdr_type);
+
+CREATE INDEX idx_provider_services_npi_hcpcs
+    ON provider_services (rndrng_npi, hcpcs_cd);
@@ -0,0 +1,14 @@
+-- Successful LLM parses of search queries, recorded by every instance as
+-- training examples for the local query model (see src/classifier.py).
+
+CREATE TABLE IF NOT EXISTS query_parses (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    query TEXT NOT NULL,
+    specialty VARCHAR(128) NOT NULL,
+    hcpcs_prefix VARCHAR(8) NOT NULL,
+    zipcode CHAR(5) NULL,
+    city VARCHAR(128) NULL,
+    state CHAR(2) NULL,
+    confidence VARCHAR(8) NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
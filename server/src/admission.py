@@ -0,0 +1,233 @@
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+import logging
+import math
+import os
+import threading
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Identity of the client making the current request, set by the app middleware
+current_client: ContextVar[str] = ContextVar("current_client", default="anonymous")
+
+# Number of proxies in front of the app that append to X-Forwarded-For. Only
+# the hop added by the outermost trusted proxy is used; anything to its left
+# was sent by the client and can't be trusted. 0 ignores the header.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+
+def resolve_client(forwarded_for: str | None, peer_host: str | None) -> str:
+    """Identify the client from the trusted X-Forwarded-For hop or the peer."""
+    if TRUSTED_PROXY_HOPS > 0 and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",")]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return peer_host or "anonymous"
+
+
+class OverloadedError(Exception):
+    """
+    Raised when a request is shed instead of queued.
+
+    status_code is 429 when the client already has too many requests queued,
+    and 503 when the service as a whole is over capacity.
+    """
+
+    def __init__(self, message: str, retry_after: int, status_code: int = 503):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class _Waiter:
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class Limiter:
+    """
+    Concurrency limiter with a bounded, per-client fair wait queue.
+
+    At most max_concurrent callers hold a slot at once. Further callers wait in
+    a queue that is served round-robin across clients, so one noisy client
+    can't starve the others. A caller is shed with OverloadedError instead of
+    queued if the queue is full, the client already has max_queued_per_client
+    requests waiting, or the estimated wait exceeds max_wait_seconds. Callers
+    that do queue give up once max_wait_seconds has passed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int,
+        max_queue: int,
+        max_wait_seconds: float,
+        max_queued_per_client: int,
+    ):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.max_queued_per_client = max_queued_per_client
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._queues: OrderedDict[str, deque[_Waiter]] = OrderedDict()
+
+        # Exponentially weighted moving average of time spent holding a slot
+        self._avg_hold_seconds = 0.0
+        self._admitted = 0
+        self._shed = 0
+        self._timed_out = 0
+
+    def _estimated_wait(self, position: int) -> float:
+        return (position / self.max_concurrent) * self._avg_hold_seconds
+
+    def _shed_error(self, message: str, status_code: int = 503) -> OverloadedError:
+        self._shed += 1
+        retry_after = max(1, math.ceil(self._estimated_wait(self._queued + 1)))
+        logger.warning(f"Shedding {self.name} request: {message}")
+        return OverloadedError(message, retry_after, status_code)
+
+    def acquire(self, client_id: str) -> None:
+        with self._lock:
+            if self._active < self.max_concurrent and self._queued == 0:
+                self._active += 1
+                self._admitted += 1
+                return
+
+            client_queue = self._queues.get(client_id)
+            if client_queue and len(client_queue) >= self.max_queued_per_client:
+                raise self._shed_error(
+                    f"Too many queued {self.name} requests for this client", 429
+                )
+            if self._queued >= self.max_queue:
+                raise self._shed_error(f"{self.name} queue is full")
+            if self._estimated_wait(self._queued + 1) > self.max_wait_seconds:
+                raise self._shed_error(f"{self.name} queue time exceeds budget")
+
+            waiter = _Waiter()
+            self._queues.setdefault(client_id, deque()).append(waiter)
+            self._queued += 1
+
+        waiter.event.wait(self.max_wait_seconds)
+
+        with self._lock:
+            if waiter.granted:
+                self._admitted += 1
+                return
+
+            client_queue = self._queues[client_id]
+            client_queue.remove(waiter)
+            if not client_queue:
+                del self._queues[client_id]
+            self._queued -= 1
+            self._timed_out += 1
+            raise self._shed_error(f"Timed out waiting for {self.name} slot")
+
+    def release(self, hold_seconds: float) -> None:
+        with self._lock:
+            self._avg_hold_seconds = (
+                hold_seconds
+                if self._avg_hold_seconds == 0
+                else 0.8 * self._avg_hold_seconds + 0.2 * hold_seconds
+            )
+
+            if not self._queues:
+                self._active -= 1
+                return
+
+            # Hand the slot straight to the next client in round-robin order
+            client_id, client_queue = self._queues.popitem(last=False)
+            waiter = client_queue.popleft()
+            if client_queue:
+                self._queues[client_id] = client_queue
+            self._queued -= 1
+
+            waiter.granted = True
+            waiter.event.set()
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the current client for the duration of the block."""
+        self.acquire(current_client.get())
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active": self._active,
+                "max_concurrent": self.max_concurrent,
+                "queue_depth": self._queued,
+                "max_queue": self.max_queue,
+                "queued_clients": len(self._queues),
+                "avg_hold_ms": round(self._avg_hold_seconds * 1000, 1),
+                "admitted": self._admitted,
+                "shed": self._shed,
+                "timed_out": self._timed_out,
+            }
+
+
+MAX_QUEUED_PER_CLIENT = int(os.getenv("MAX_QUEUED_PER_CLIENT", "4"))
+
+llm_limiter = Limiter(
+    "LLM",
+    max_concurrent=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "16")),
+    max_wait_seconds=float(os.getenv("LLM_MAX_WAIT_SECONDS", "5")),
+    max_queued_per_client=MAX_QUEUED_PER_CLIENT,
+)
+
+db_limiter = Limiter(
+    "DB",
+    max_concurrent=int(os.getenv("DB_MAX_CONCURRENCY", "5")),
+    max_queue=int(os.getenv("DB_MAX_QUEUE", "16")),
+    max_wait_seconds=float(os.getenv("DB_MAX_WAIT_SECONDS", "2")),
+    max_queued_per_client=MAX_QUEUED_PER_CLIENT,
+)
+
+# Streaming searches hold a connection for as long as the client takes to read
+# the results, so they get their own slots and wait-time estimate
+stream_limiter = Limiter(
+    "stream",
+    max_concurrent=int(os.getenv("STREAM_MAX_CONCURRENCY", "5")),
+    max_queue=int(os.getenv("STREAM_MAX_QUEUE", "8")),
+    max_wait_seconds=float(os.getenv("STREAM_MAX_WAIT_SECONDS", "2")),
+    max_queued_per_client=MAX_QUEUED_PER_CLIENT,
+)
+
+
+# Threads for requests that don't take a slot, e.g. cached searches and typeahead
+THREADPOOL_HEADROOM = int(os.getenv("THREADPOOL_HEADROOM", "10"))
+
+
+def threadpool_size() -> int:
+    """
+    Worker threads needed so every slot holder and queued waiter has its own
+    thread. Waiters block a thread, so a smaller pool would queue requests
+    ahead of the limiters with no deadline, and let one limiter's waiters
+    starve requests for the others.
+    """
+    return THREADPOOL_HEADROOM + sum(
+        limiter.max_concurrent + limiter.max_queue
+        for limiter in (llm_limiter, db_limiter, stream_limiter)
+    )
+
+
+def get_stats() -> dict:
+    return {
+        "llm": llm_limiter.stats(),
+        "db": db_limiter.stats(),
+        "stream": stream_limiter.stats(),
+    }
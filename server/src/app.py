@@ -1,15 +1,68 @@
+# Imported first so startup.PROCESS_START is as close to process start as possible
+from . import startup
+
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from typing import Annotated
 import os
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from .models import NLSResponse, RankRequest, RankedProvidersResponse, SearchRequest
-from .service import natural_language_search, rank_providers_nl
+from .admission import (
+    OverloadedError,
+    current_client,
+    get_stats,
+    resolve_client,
+    threadpool_size,
+)
+from .http_cache import (
+    CACHE_CONTROL,
+    NO_STORE,
+    canonical_params,
+    current_data_version,
+    etag_matches,
+    get_data_version,
+    make_etag,
+)
+
+from .models import (
+    NLSResponse,
+    ProviderSearchParams,
+    RankRequest,
+    RankedProvidersResponse,
+    SearchAndRankRequest,
+    SearchAndRankResponse,
+    SearchRequest,
+    SuggestResponse,
+)
+from .service import (
+    natural_language_search,
+    rank_providers_nl,
+    search_and_rank_nl,
+    search_with_params,
+    stream_natural_language_search,
+)
+from .typeahead import MAX_SUGGESTIONS, suggest
 
 
 load_dotenv()
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    import anyio.to_thread
+
+    # Sync handlers run in AnyIO's threadpool (40 threads by default), which
+    # must fit every limiter slot and waiter
+    thread_limiter = anyio.to_thread.current_default_thread_limiter()
+    thread_limiter.total_tokens = max(thread_limiter.total_tokens, threadpool_size())
+    startup.start_warmup()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [os.getenv("CLIENT_URL")]
 
@@ -19,12 +72,102 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Data-Version"],
 )
 
 
+@app.middleware("http")
+async def identify_client(request: Request, call_next):
+    client_id = resolve_client(
+        request.headers.get("x-forwarded-for"),
+        request.client.host if request.client else None,
+    )
+    current_client.set(client_id)
+    return await call_next(request)
+
+
+@app.exception_handler(OverloadedError)
+async def handle_overloaded(request: Request, exc: OverloadedError) -> JSONResponse:
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"success": False, "error": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+# Health endpoints are async so they don't wait on the request threadpool,
+# which can be occupied by requests queued for admission
+@app.get("/healthz")
+async def handle_healthz() -> dict:
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def handle_readyz(response: Response) -> dict:
+    is_ready = startup.ready.is_set()
+    if not is_ready:
+        response.status_code = 503
+    return {
+        "ready": is_ready,
+        "data_version": current_data_version(),
+        "steps": startup.get_steps(),
+        "profile": startup.get_profile(),
+    }
+
+
+@app.get("/api/admission_stats")
+async def handle_admission_stats() -> dict:
+    return get_stats()
+
+
 @app.post("/api/search_providers")
 def handle_search(req: SearchRequest) -> NLSResponse:
     res = natural_language_search(req.query)
+    if res.success:
+        startup.record_first_search()
+    return res
+
+
+@app.post("/api/search_providers/stream")
+def handle_search_stream(req: SearchRequest) -> StreamingResponse:
+    events = stream_natural_language_search(req.query)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/search_providers")
+def handle_search_by_params(
+    params: Annotated[ProviderSearchParams, Query()],
+    response: Response,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> NLSResponse:
+    params = canonical_params(params)
+    data_version = get_data_version()
+
+    # Without a data version the response can't be safely revalidated
+    if data_version is None:
+        response.headers["Cache-Control"] = NO_STORE
+        return search_with_params(params, strict=True)
+
+    etag = make_etag(params, data_version)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "X-Data-Version": data_version,
+    }
+
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    res = search_with_params(params, strict=True)
+    if res.success:
+        response.headers.update(headers)
+    else:
+        response.headers["Cache-Control"] = NO_STORE
     return res
 
 
@@ -32,3 +175,22 @@ def handle_search(req: SearchRequest) -> NLSResponse:
 def handle_rank(req: RankRequest) -> RankedProvidersResponse:
     res = rank_providers_nl(req.query, req.provider_ids)
     return res
+
+
+@app.post("/api/search_and_rank")
+def handle_search_and_rank(req: SearchAndRankRequest) -> SearchAndRankResponse:
+    res = search_and_rank_nl(req.query, req.top_k)
+    if res.success:
+        startup.record_first_search()
+    return res
+
+
+# Async because a trie lookup is far cheaper than a threadpool hop
+@app.get("/api/suggest")
+async def handle_suggest(
+    q: str, limit: Annotated[int, Query(ge=1, le=MAX_SUGGESTIONS)] = 8
+) -> SuggestResponse:
+    prefix, prefix_start, suggestions = suggest(q, limit)
+    return SuggestResponse(
+        prefix=prefix, prefix_start=prefix_start, suggestions=suggestions
+    )
@@ -0,0 +1,419 @@
+"""
+Local query classifier trained from logged LLM parses.
+
+Every successful parse_provider_query result is recorded as a labelled
+example (query text -> specialty, hcpcs_prefix) in the query_parses table
+(see sql/query_parses.sql), so records from every instance survive restarts.
+A TF-IDF nearest-centroid model is trained offline from those records and
+loaded in-process at startup, so queries it is confident about can be
+answered without calling OpenAI.
+
+Usage:
+    python -m src.classifier train      # train on the recorded parses and save the model
+    python -m src.classifier evaluate   # report agreement with the LLM on a holdout
+"""
+
+from collections import Counter, defaultdict
+from dotenv import load_dotenv
+from functools import cache
+import json
+import logging
+import math
+import os
+import queue
+import re
+import sys
+import threading
+
+from .constants import HCPCS_MAPPINGS, MEDICARE_SPECIALTIES, US_STATES
+from .models import ProviderSearchParams
+from .queries import get_query_parses, insert_query_parses
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH", "data/query_model.json")
+
+# Minimum probability for both specialty and hcpcs_prefix to skip the LLM
+CONFIDENCE_THRESHOLD = float(os.getenv("LOCAL_MODEL_THRESHOLD", "0.9"))
+# Minimum holdout agreement with the LLM before a trained model is saved
+MIN_AGREEMENT = float(os.getenv("LOCAL_MODEL_MIN_AGREEMENT", "0.95"))
+# Labels with fewer examples than this are left to the LLM
+MIN_EXAMPLES_PER_LABEL = 3
+# Scales cosine similarities before the softmax; higher means peakier probabilities
+SHARPNESS = 20.0
+# Every HOLDOUT_EVERY-th example is held out for evaluation
+HOLDOUT_EVERY = 5
+
+TARGETS = ("specialty", "hcpcs_prefix")
+
+# Parses waiting to be written; more than this are dropped rather than queued
+PARSE_QUEUE_SIZE = 1000
+# Most parses written in one INSERT
+PARSE_BATCH_SIZE = 100
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase words and word bigrams, with digits removed."""
+    words = re.findall(r"[a-z][a-z'-]*", text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+# Only a ZIP code after a location word, so procedure codes like 93306 aren't
+# taken for one
+ZIP_PATTERN = re.compile(r"\b(?i:in|near|around)\s+(\d{5})(?:-\d{4})?\b")
+FIVE_DIGITS_PATTERN = re.compile(r"\b\d{5}\b")
+_STATE_NAMES = "|".join(
+    re.escape(name) for name in sorted(US_STATES, key=len, reverse=True)
+)
+_CITY_PREFIX = r"(?:(?i:downtown|uptown|central|greater|the)\s+)?"
+# With a state code the user is typing in proper case, so require capitalized
+# city words to avoid matching phrases like "in pain OR ..."
+_PROPER_CITY = r"([A-Z][A-Za-z.'-]*(?:\s+[A-Z][A-Za-z.'-]*){0,3}?)"
+_ANY_CITY = r"([A-Za-z][A-Za-z.'-]*(?:\s+[A-Za-z][A-Za-z.'-]*){0,3}?)"
+STATE_CODE_PATTERN = re.compile(
+    rf"\b(?i:in|near|around)\s+{_CITY_PREFIX}{_PROPER_CITY},?\s+([A-Z]{{2}})\b"
+)
+STATE_NAME_PATTERN = re.compile(
+    rf"\b(?i:in|near|around)\s+{_CITY_PREFIX}{_ANY_CITY},?\s+(?i:({_STATE_NAMES}))\b"
+)
+
+
+def _extract_city_state(text: str) -> dict | None:
+    codes = set(US_STATES.values())
+    names = {name.lower(): code for name, code in US_STATES.items()}
+
+    for pattern in (STATE_CODE_PATTERN, STATE_NAME_PATTERN):
+        for match in pattern.finditer(text):
+            city = match.group(1)
+            state = match.group(2)
+
+            # "in West Virginia" is a state, not the city "West" in Virginia
+            full = f"{city} {state}".lower()
+            if any(
+                full.endswith(name) and len(name) > len(state) for name in names
+            ):
+                continue
+
+            state = state if state in codes else names.get(state.lower())
+            if state:
+                city = " ".join(word.capitalize() for word in city.split())
+                return {"zipcode": None, "city": city, "state": state}
+
+    return None
+
+
+def extract_location(text: str) -> dict | None:
+    """
+    Extract a ZIP code, or a city and state, from the query with simple rules.
+
+    Returns None if no location can be found, or if the query is ambiguous: a
+    5-digit number that isn't the ZIP code (e.g. a procedure code), or both a
+    ZIP code and a city and state.
+    """
+    zip_matches = {m.group(1) for m in ZIP_PATTERN.finditer(text)}
+    numbers = set(FIVE_DIGITS_PATTERN.findall(text))
+    if len(zip_matches) > 1 or numbers - zip_matches:
+        return None
+
+    city_state = _extract_city_state(text)
+    if zip_matches:
+        if city_state:
+            return None
+        return {"zipcode": zip_matches.pop(), "city": None, "state": None}
+
+    return city_state
+
+
+class QueryClassifier:
+    """
+    TF-IDF nearest-centroid classifier with one set of centroids per target.
+
+    Each label is represented by the normalized mean TF-IDF vector of its
+    examples, and a query is scored by cosine similarity to each centroid.
+    Probabilities are a softmax over the scaled similarities.
+    """
+
+    def __init__(
+        self,
+        idf: dict[str, float] | None = None,
+        centroids: dict[str, dict[str, dict[str, float]]] | None = None,
+    ):
+        self.idf = idf or {}
+        self.centroids = centroids or {target: {} for target in TARGETS}
+
+    def vectorize(self, text: str) -> dict[str, float]:
+        counts = Counter(t for t in tokenize(text) if t in self.idf)
+        vector = {t: count * self.idf[t] for t, count in counts.items()}
+        return _normalize(vector)
+
+    def fit(self, examples: list[dict]) -> "QueryClassifier":
+        doc_freq: Counter[str] = Counter()
+        for example in examples:
+            doc_freq.update(set(tokenize(example["query"])))
+
+        n = len(examples)
+        self.idf = {t: math.log((1 + n) / (1 + df)) + 1 for t, df in doc_freq.items()}
+        vectors = [self.vectorize(example["query"]) for example in examples]
+
+        for target in TARGETS:
+            sums: dict[str, defaultdict[str, float]] = {}
+            label_counts: Counter[str] = Counter()
+
+            for example, vector in zip(examples, vectors):
+                label = example[target]
+                label_counts[label] += 1
+                label_sum = sums.setdefault(label, defaultdict(float))
+                for t, weight in vector.items():
+                    label_sum[t] += weight
+
+            self.centroids[target] = {
+                label: _normalize(dict(label_sum))
+                for label, label_sum in sums.items()
+                if label_counts[label] >= MIN_EXAMPLES_PER_LABEL
+            }
+
+        return self
+
+    def predict(self, text: str) -> dict[str, tuple[str | None, float]]:
+        """Return the best label and its probability for each target."""
+        vector = self.vectorize(text)
+        predictions = {}
+
+        for target in TARGETS:
+            centroids = self.centroids.get(target, {})
+            if not vector or not centroids:
+                predictions[target] = (None, 0.0)
+                continue
+
+            scores = {
+                label: sum(w * centroid.get(t, 0.0) for t, w in vector.items())
+                for label, centroid in centroids.items()
+            }
+            best = max(scores, key=scores.get)
+            exps = {
+                label: math.exp(SHARPNESS * (s - scores[best]))
+                for label, s in scores.items()
+            }
+            predictions[target] = (best, 1 / sum(exps.values()))
+
+        return predictions
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"idf": self.idf, "centroids": self.centroids}, f)
+        # Replace atomically so a running server never sees a partial file
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "QueryClassifier":
+        with open(path) as f:
+            data = json.load(f)
+        return cls(idf=data["idf"], centroids=data["centroids"])
+
+
+def _normalize(vector: dict[str, float]) -> dict[str, float]:
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    if norm == 0:
+        return {}
+    return {t: w / norm for t, w in vector.items()}
+
+
+_parse_queue: queue.Queue[dict] = queue.Queue(maxsize=PARSE_QUEUE_SIZE)
+_writer_lock = threading.Lock()
+_writer: threading.Thread | None = None
+
+
+def _write_parses() -> None:
+    """Write queued parses in batches, forever."""
+    while True:
+        records = [_parse_queue.get()]
+        while len(records) < PARSE_BATCH_SIZE:
+            try:
+                records.append(_parse_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            insert_query_parses(records)
+        except Exception as e:
+            logger.warning(f"Failed to record {len(records)} parses: {str(e)}")
+
+
+def record_parse(user_query: str, params: ProviderSearchParams) -> None:
+    """
+    Queue a successful LLM parse to be recorded as a training example.
+
+    The write happens on a background thread so a search never waits on it,
+    and parses are dropped if the queue is full.
+    """
+    global _writer
+
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(
+                target=_write_parses, name="parse-writer", daemon=True
+            )
+            _writer.start()
+
+    try:
+        _parse_queue.put_nowait({"query": user_query, **params.model_dump()})
+    except queue.Full:
+        logger.warning("Parse queue is full, dropping parse")
+
+
+def load_examples() -> list[dict]:
+    """
+    Load usable training examples from the recorded parses, skipping low
+    confidence parses and labels outside the approved lists.
+    """
+    return [
+        example
+        for example in get_query_parses()
+        if example["confidence"] != "low"
+        and example["specialty"] in MEDICARE_SPECIALTIES
+        and example["hcpcs_prefix"] in HCPCS_MAPPINGS
+    ]
+
+
+@cache
+def get_classifier() -> QueryClassifier | None:
+    """Load the trained model once, or return None if there isn't a usable one."""
+    if not os.path.exists(LOCAL_MODEL_PATH):
+        logger.info(f"No local query model at {LOCAL_MODEL_PATH}")
+        return None
+    try:
+        return QueryClassifier.load(LOCAL_MODEL_PATH)
+    except Exception as e:
+        logger.warning(f"Failed to load local query model: {str(e)}")
+        return None
+
+
+def parse_query_locally(
+    user_query: str,
+    model: QueryClassifier | None = None,
+    threshold: float = CONFIDENCE_THRESHOLD,
+) -> ProviderSearchParams | None:
+    """
+    Parse the query with the local model if it is confident about every field.
+
+    Returns None when the LLM should be used instead: no model is loaded, no
+    location could be extracted, or either prediction is below threshold.
+    """
+    model = model or get_classifier()
+    if model is None:
+        return None
+
+    location = extract_location(user_query)
+    if location is None:
+        return None
+
+    predictions = model.predict(user_query)
+    specialty, specialty_prob = predictions["specialty"]
+    hcpcs_prefix, hcpcs_prob = predictions["hcpcs_prefix"]
+
+    if specialty_prob < threshold or hcpcs_prob < threshold:
+        return None
+
+    logger.info(
+        f"Parsed locally: specialty={specialty} ({specialty_prob:.2f}), "
+        f"hcpcs={hcpcs_prefix} ({hcpcs_prob:.2f})"
+    )
+    return ProviderSearchParams(
+        specialty=specialty,
+        hcpcs_prefix=hcpcs_prefix,
+        confidence="high",
+        **location,
+    )
+
+
+def evaluate(
+    model: QueryClassifier,
+    examples: list[dict],
+    threshold: float = CONFIDENCE_THRESHOLD,
+) -> dict:
+    """
+    Measure agreement between the local model and the logged LLM parses.
+
+    coverage is the share of examples the model would answer on its own, and
+    the agreement figures are computed over those covered examples only.
+    """
+    covered = 0
+    agree = Counter()
+
+    for example in examples:
+        params = parse_query_locally(example["query"], model, threshold)
+        if params is None:
+            continue
+
+        covered += 1
+        fields = {
+            "specialty": params.specialty == example["specialty"],
+            "hcpcs_prefix": params.hcpcs_prefix == example["hcpcs_prefix"],
+            "location": (params.zipcode, params.city, params.state)
+            == (example.get("zipcode"), example.get("city"), example.get("state")),
+        }
+        agree.update(name for name, matched in fields.items() if matched)
+        if all(fields.values()):
+            agree["all"] += 1
+
+    return {
+        "examples": len(examples),
+        "coverage": covered / len(examples) if examples else 0.0,
+        **{
+            f"agreement_{name}": agree[name] / covered if covered else 0.0
+            for name in ("specialty", "hcpcs_prefix", "location", "all")
+        },
+    }
+
+
+def split_holdout(examples: list[dict]) -> tuple[list[dict], list[dict]]:
+    train = [e for i, e in enumerate(examples) if i % HOLDOUT_EVERY != 0]
+    holdout = [e for i, e in enumerate(examples) if i % HOLDOUT_EVERY == 0]
+    return train, holdout
+
+
+def main(argv: list[str]) -> int:
+    command = argv[1] if len(argv) > 1 else "evaluate"
+    if command not in ("train", "evaluate"):
+        print(__doc__)
+        return 2
+
+    try:
+        examples = load_examples()
+    except Exception as e:
+        print(
+            f"Could not read recorded parses: {str(e).splitlines()[0]}\n"
+            "Check the database settings and that the query_parses table exists "
+            "(see sql/query_parses.sql)"
+        )
+        return 1
+
+    if not examples:
+        print("No usable parses have been recorded yet, nothing to train on")
+        return 1
+
+    train, holdout = split_holdout(examples)
+    metrics = evaluate(QueryClassifier().fit(train), holdout)
+    print(json.dumps(metrics, indent=2))
+
+    if command == "train":
+        if metrics["agreement_all"] < MIN_AGREEMENT:
+            print(
+                f"Holdout agreement {metrics['agreement_all']:.3f} is below "
+                f"{MIN_AGREEMENT}, not saving model"
+            )
+            return 1
+
+        QueryClassifier().fit(examples).save(LOCAL_MODEL_PATH)
+        print(f"Saved model trained on {len(examples)} examples to {LOCAL_MODEL_PATH}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv))
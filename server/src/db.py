@@ -1,8 +1,8 @@
 from dotenv import load_dotenv
+from functools import cache
+import json
 import os
 
-from sqlalchemy import create_engine
-
 load_dotenv()
 
 DB_HOST = os.getenv("DB_HOST")
@@ -12,4 +12,27 @@ DB_NAME = os.getenv("DB_NAME")
 
 URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
 
-engine = create_engine(URL, pool_pre_ping=True, pool_recycle=3600)
+# Optional per-state databases, e.g. read replicas or embedded SQLite files:
+# DB_STATE_URLS='{"CA": "mysql+pymysql://...", "TX": "sqlite:///data/tx.db"}'
+STATE_URLS: dict[str, str] = json.loads(os.getenv("DB_STATE_URLS", "{}"))
+
+
+@cache
+def _engine_for_url(url: str):
+    """
+    Create a shared SQLAlchemy engine for the URL on first use.
+
+    SQLAlchemy and pymysql are imported here rather than at module level so
+    they don't count against container cold start.
+    """
+    from sqlalchemy import create_engine
+
+    return create_engine(url, pool_pre_ping=True, pool_recycle=3600)
+
+
+def get_engine(state: str | None = None):
+    """
+    Engine holding the given state's providers, or the main database if the
+    state has no database of its own.
+    """
+    return _engine_for_url(STATE_URLS.get(state, URL))
@@ -0,0 +1,110 @@
+"""
+HTTP caching for read-only search responses.
+
+The CMS data only changes when a new release is ingested, so a search is
+fully determined by its parameters and the data version. ETags are derived
+from both, which lets a conditional request be answered with a 304 before
+touching the database.
+"""
+
+from dotenv import load_dotenv
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from .models import ProviderSearchParams
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# The ingest should set DATA_VERSION on deploy, or write each new version to the
+# data_version table (see sql/data_version.sql)
+DATA_VERSION = os.getenv("DATA_VERSION")
+DATA_VERSION_TTL_SECONDS = 300
+CACHE_MAX_AGE_SECONDS = int(os.getenv("SEARCH_CACHE_MAX_AGE", "86400"))
+
+CACHE_CONTROL = f"public, max-age={CACHE_MAX_AGE_SECONDS}"
+NO_STORE = "no-store"
+
+_version: str | None = DATA_VERSION
+_version_checked_at = 0.0
+_version_lock = threading.Lock()
+
+
+def get_data_version() -> str | None:
+    """
+    Current data version: DATA_VERSION if set, otherwise the latest row in
+    the data_version table, re-read at most every DATA_VERSION_TTL_SECONDS so
+    a new ingest busts caches automatically.
+    """
+    global _version, _version_checked_at
+
+    if DATA_VERSION:
+        return DATA_VERSION
+
+    with _version_lock:
+        if time.monotonic() - _version_checked_at < DATA_VERSION_TTL_SECONDS:
+            return _version
+        _version_checked_at = time.monotonic()
+
+    try:
+        from .queries import get_data_version as query_data_version
+
+        version = query_data_version()
+    except Exception as e:
+        logger.warning(f"Failed to read data version: {str(e)}")
+        return _version
+
+    if version != _version:
+        logger.info(f"Data version is now {version}")
+    _version = version
+    return version
+
+
+def current_data_version() -> str | None:
+    """Last known data version, without refreshing it."""
+    return _version
+
+
+def canonical_params(params: ProviderSearchParams) -> ProviderSearchParams:
+    """
+    Drop fields that don't affect the results, so equivalent searches share
+    a cache key. A ZIP code takes priority over city and state.
+    """
+    if params.zipcode:
+        return ProviderSearchParams(
+            specialty=params.specialty,
+            hcpcs_prefix=params.hcpcs_prefix,
+            zipcode=params.zipcode,
+        )
+    return ProviderSearchParams(
+        specialty=params.specialty,
+        hcpcs_prefix=params.hcpcs_prefix,
+        city=params.city,
+        state=params.state,
+    )
+
+
+def make_etag(params: ProviderSearchParams, data_version: str) -> str:
+    key = json.dumps(
+        {"version": data_version, **params.model_dump(exclude={"confidence"})},
+        sort_keys=True,
+    )
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against the ETag."""
+    if not if_none_match:
+        return False
+
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+
+    return False
@@ -26,6 +26,15 @@ class UserDemographics(BaseModel):
     race: str | None = None
 
 
+class SearchAndRankParams(BaseModel):
+    """
+    Structured output for a combined search and ranking query
+    """
+
+    search: ProviderSearchParams
+    demographics: UserDemographics
+
+
 class Provider(BaseModel):
     """
     Provider data retrieved from the database
@@ -84,6 +93,15 @@ class RankRequest(BaseModel):
     provider_ids: list[int]
 
 
+class SearchAndRankRequest(BaseModel):
+    """
+    Client request for a combined provider search and ranking
+    """
+
+    query: str
+    top_k: int = Field(100, ge=1, le=10000)
+
+
 class NLSResponse(BaseModel):
     success: bool
     parsed_params: dict
@@ -98,3 +116,24 @@ class RankedProvidersResponse(BaseModel):
     parsed_params: dict
     results: list[ScoredProvider]
     error: str | None = None
+
+
+class SearchAndRankResponse(BaseModel):
+    success: bool
+    parsed_params: dict
+    results: list[ScoredProvider]
+    hcpcs_desc: str | None = None
+    count: int | None = None
+    error: str | None = None
+
+
+class Suggestion(BaseModel):
+    type: str
+    label: str
+    count: int = 0
+
+
+class SuggestResponse(BaseModel):
+    prefix: str
+    prefix_start: int
+    suggestions: list[Suggestion]
@@ -0,0 +1,109 @@
+"""
+Routing of provider searches to state partitions.
+
+The providers and provider_services tables are partitioned by state (see
+sql/partition_by_state.sql), and a state can also be served from its own
+database (see DB_STATE_URLS in db.py). Every search is filtered on state so it
+only touches one partition. ZIP-only searches get their state from a ZIP to
+state lookup held in memory.
+
+Usage:
+    python -m src.partitions export TX data/tx.db   # copy one state to a SQLite file
+"""
+
+from dotenv import load_dotenv
+import logging
+import os
+import sys
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Set once provider_services has its own state column (added by the migration),
+# so it can be pruned too rather than only through the join
+SERVICES_STATE_COLUMN = os.getenv("SERVICES_STATE_COLUMN", "false").lower() == "true"
+
+EXPORT_BATCH_SIZE = 5000
+
+_zip_states: dict[str, list[str]] | None = None
+
+
+def load_zip_states() -> None:
+    """Load the ZIP to state lookup from the database."""
+    from .queries import get_zip_states
+
+    global _zip_states
+    zip_states: dict[str, list[str]] = {}
+    for zipcode, state in get_zip_states():
+        zip_states.setdefault(zipcode, []).append(state)
+
+    _zip_states = zip_states
+    logger.info(f"Loaded states for {len(zip_states)} ZIP codes")
+
+
+def states_for_zip(zipcode: str) -> list[str] | None:
+    """
+    States with providers in the ZIP code. Almost always a single state, but a
+    few ZIP codes cross state lines.
+
+    Returns an empty list if the ZIP code isn't in the lookup, and None if the
+    lookup hasn't been loaded yet.
+    """
+    if _zip_states is None:
+        return None
+    return _zip_states.get(zipcode, [])
+
+
+def export_state(state: str, url: str) -> None:
+    """
+    Copy one state's providers and provider services from the main database
+    into the database at url, creating the tables if needed.
+    """
+    from sqlalchemy import MetaData, create_engine, select
+
+    from .db import get_engine
+
+    source = get_engine()
+    target = create_engine(url)
+
+    metadata = MetaData()
+    metadata.reflect(source, only=["providers", "provider_services"])
+    metadata.create_all(target)
+
+    providers = metadata.tables["providers"]
+    services = metadata.tables["provider_services"]
+    in_state = providers.c.rndrng_prvdr_state_abrvtn == state
+
+    queries = {
+        providers: select(providers).where(in_state),
+        services: select(services)
+        .join(providers, services.c.rndrng_npi == providers.c.rndrng_npi)
+        .where(in_state),
+    }
+
+    with source.connect() as src, target.begin() as dst:
+        for table, query in queries.items():
+            count = 0
+            result = src.execution_options(stream_results=True).execute(query)
+            for rows in result.mappings().partitions(EXPORT_BATCH_SIZE):
+                dst.execute(table.insert(), [dict(row) for row in rows])
+                count += len(rows)
+            logger.info(f"Exported {count} {table.name} rows for {state}")
+
+
+def main(argv: list[str]) -> int:
+    if len(argv) != 4 or argv[1] != "export":
+        print(__doc__)
+        return 2
+
+    state, path = argv[2].upper(), argv[3]
+    url = path if "://" in path else f"sqlite:///{path}"
+    export_state(state, url)
+    print(f'Add "{state}": "{url}" to DB_STATE_URLS to serve {state} from it')
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv))
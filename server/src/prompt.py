@@ -1,14 +1,34 @@
-from openai import OpenAI
-from typing import Optional
+from functools import cache
+from typing import TYPE_CHECKING, Callable, Optional, TypeVar
 import logging
 
-from .models import ProviderSearchParams, UserDemographics
+from .admission import OverloadedError, llm_limiter
+from .models import ProviderSearchParams, SearchAndRankParams, UserDemographics
 from .constants import HCPCS_MAPPINGS, MEDICARE_SPECIALTIES
 
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+T = TypeVar("T")
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+@cache
+def get_client() -> "OpenAI":
+    """
+    Shared OpenAI client, created on first use.
+
+    Reusing one client keeps its HTTP connection pool (and TLS session) warm
+    between requests, and importing openai here keeps it off the cold start path.
+    """
+    from openai import OpenAI
+
+    return OpenAI()
+
+
+@cache
 def create_system_prompt() -> str:
     """Generate the system prompt with current specialty list."""
     specialty_list = "\n    - ".join(sorted(MEDICARE_SPECIALTIES))
@@ -69,47 +89,47 @@ If you cannot confidently determine a parameter, make your best educated guess a
 """
 
 
-def parse_provider_query(
+def _parse_structured(
     user_input: str,
-    client: Optional[OpenAI] = None,
-    model: str = "gpt-4o-mini",
-    max_retries: int = 2,
-) -> ProviderSearchParams:
+    system_prompt: str,
+    text_format: type[T],
+    validate: Callable[[T, bool], str | None],
+    client: Optional["OpenAI"],
+    model: str,
+    max_retries: int,
+    description: str,
+) -> T:
     """
-    Parse natural language input to extract provider search parameters.
+    Parse the user input into text_format with a structured output call,
+    retrying incomplete, empty and invalid responses.
 
-    Uses OpenAI's Responses API with Structured Outputs to guarantee schema adherence.
-
-    Args:
-        user_input: Natural language query from user
-        client: OpenAI client instance (creates new one if None)
-        model: OpenAI model to use (gpt-4o-mini recommended)
-        max_retries: Number of retry attempts on failure
-
-    Returns:
-        ProviderSearchParams: Structured search parameters
+    validate is called with the parsed result and whether another attempt is
+    left. It returns an error message to retry (or fail on the last attempt),
+    or None to accept the result, after fixing it in place if needed.
 
     Raises:
         ValueError: If parsing fails after retries
     """
     if client is None:
-        client = OpenAI()
-
-    system_prompt = create_system_prompt()
+        client = get_client()
 
     for attempt in range(max_retries + 1):
+        can_retry = attempt < max_retries
         try:
-            logger.info(f"Parsing query (attempt {attempt + 1}): {user_input[:100]}...")
+            logger.info(
+                f"Parsing {description} (attempt {attempt + 1}): {user_input[:100]}..."
+            )
 
             # Using Responses API with structured outputs
-            response = client.responses.parse(
-                model=model,
-                input=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_input},
-                ],
-                text_format=ProviderSearchParams,
-            )
+            with llm_limiter.slot():
+                response = client.responses.parse(
+                    model=model,
+                    input=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_input},
+                    ],
+                    text_format=text_format,
+                )
 
             # Check for incomplete response
             if response.status == "incomplete":
@@ -119,62 +139,131 @@ def parse_provider_query(
                     else "unknown"
                 )
                 logger.warning(f"Incomplete response: {reason}")
-                if attempt < max_retries:
+                if can_retry:
                     continue
                 raise ValueError(f"Response incomplete: {reason}")
 
             parsed_data = response.output_parsed
-
             if parsed_data is None:
                 raise ValueError("OpenAI returned empty parsed response")
 
-            # Validate specialty is in approved list
-            if parsed_data.specialty not in MEDICARE_SPECIALTIES:
-                logger.warning(f"Invalid specialty returned: {parsed_data.specialty}")
-                if attempt < max_retries:
-                    continue
-                raise ValueError(
-                    f"Specialty '{parsed_data.specialty}' not in approved list"
-                )
-
-            # Validate location parameters
-            if not parsed_data.zipcode and not (parsed_data.city and parsed_data.state):
-                logger.warning("Neither zipcode nor city/state provided")
-                if attempt < max_retries:
+            error = validate(parsed_data, can_retry)
+            if error:
+                logger.warning(error)
+                if can_retry:
                     continue
-                raise ValueError("Must provide either zipcode or both city and state")
-
-            location_str = (
-                f"zipcode={parsed_data.zipcode}"
-                if parsed_data.zipcode
-                else f"location={parsed_data.city}, {parsed_data.state}"
-            )
-
-            logger.info(
-                f"Successfully parsed: specialty={parsed_data.specialty}, "
-                f"{location_str}, "
-                f"hcpcs={parsed_data.hcpcs_prefix}, confidence={parsed_data.confidence}"
-            )
+                raise ValueError(error)
 
             return parsed_data
 
+        except OverloadedError:
+            raise
         except Exception as e:
             logger.error(f"Parsing attempt {attempt + 1} failed: {str(e)}")
-            if attempt == max_retries:
+            if not can_retry:
                 raise ValueError(
-                    f"Failed to parse query after {max_retries + 1} attempts: {str(e)}"
+                    f"Failed to parse {description} after {max_retries + 1} attempts: {str(e)}"
                 )
 
-    raise ValueError("Unexpected error in parse_provider_query")
+    raise ValueError(f"Unexpected error parsing {description}")
+
+
+def _search_params_error(params: ProviderSearchParams) -> str | None:
+    """Check the specialty is in the approved list and a location was given."""
+    if params.specialty not in MEDICARE_SPECIALTIES:
+        return f"Specialty '{params.specialty}' not in approved list"
+    if not params.zipcode and not (params.city and params.state):
+        return "Must provide either zipcode or both city and state"
+    return None
+
+
+def parse_provider_query(
+    user_input: str,
+    client: Optional["OpenAI"] = None,
+    model: str = "gpt-4o-mini",
+    max_retries: int = 2,
+) -> ProviderSearchParams:
+    """
+    Parse natural language input to extract provider search parameters.
+
+    Uses OpenAI's Responses API with Structured Outputs to guarantee schema adherence.
+
+    Args:
+        user_input: Natural language query from user
+        client: OpenAI client instance (uses the shared client if None)
+        model: OpenAI model to use (gpt-4o-mini recommended)
+        max_retries: Number of retry attempts on failure
+
+    Returns:
+        ProviderSearchParams: Structured search parameters
+
+    Raises:
+        ValueError: If parsing fails after retries
+    """
+    parsed_data = _parse_structured(
+        user_input,
+        create_system_prompt(),
+        ProviderSearchParams,
+        lambda params, can_retry: _search_params_error(params),
+        client,
+        model,
+        max_retries,
+        "query",
+    )
+
+    location_str = (
+        f"zipcode={parsed_data.zipcode}"
+        if parsed_data.zipcode
+        else f"location={parsed_data.city}, {parsed_data.state}"
+    )
+
+    logger.info(
+        f"Successfully parsed: specialty={parsed_data.specialty}, "
+        f"{location_str}, "
+        f"hcpcs={parsed_data.hcpcs_prefix}, confidence={parsed_data.confidence}"
+    )
+
+    return parsed_data
 
 
 ALLOWED_SEX = {"male", "female"}
 ALLOWED_RACE = {"white", "black", "asian", "hispanic", "native", "other"}
 
+DEMOGRAPHICS_PROMPT = (
+    "You are an assistant that extracts demographic information from user text. "
+    "Return ONLY a JSON object with fields 'age', 'sex', and 'race'. "
+    "If a field is not mentioned, return null. "
+    "Allowed values: sex = male, female; "
+    "race = white, black, asian, hispanic, native, other."
+)
+
+
+def _clean_demographics(
+    demographics: UserDemographics, can_retry: bool = False
+) -> str | None:
+    """
+    Lowercase sex and race so they match the values scoring compares against.
+    An invalid value is reported for a retry if one is left, otherwise dropped.
+    """
+    for field, allowed in (("sex", ALLOWED_SEX), ("race", ALLOWED_RACE)):
+        value = getattr(demographics, field)
+        if not value:
+            continue
+
+        value = value.strip().lower()
+        if value not in allowed:
+            if can_retry:
+                return f"Invalid {field} returned: {value}"
+            logger.warning(f"Invalid {field} returned: {value}")
+            value = None
+        setattr(demographics, field, value)
+
+    return None
+
 
 def parse_user_demographics(
     user_input: str,
-    client: Optional[OpenAI] = None,
+    client: Optional["OpenAI"] = None,
     model: str = "gpt-4o-mini",
     max_retries: int = 2,
 ) -> UserDemographics:
@@ -185,7 +274,7 @@ def parse_user_demographics(
 
     Args:
         user_input: Natural language query from user
-        client: OpenAI client instance (creates new one if None)
+        client: OpenAI client instance (uses the shared client if None)
         model: OpenAI model to use
         max_retries: Number of retry attempts on failure
 
@@ -195,67 +284,79 @@ def parse_user_demographics(
     Raises:
         ValueError: If parsing fails after retries
     """
-    if client is None:
-        client = OpenAI()
-
-    system_prompt = (
-        "You are an assistant that extracts demographic information from user text. "
-        "Return ONLY a JSON object with fields 'age', 'sex', and 'race'. "
-        "If a field is not mentioned, return null. "
-        "Allowed values: sex = male, female; "
-        "race = white, black, asian, hispanic, native, other."
+    parsed_data = _parse_structured(
+        user_input,
+        DEMOGRAPHICS_PROMPT,
+        UserDemographics,
+        _clean_demographics,
+        client,
+        model,
+        max_retries,
+        "demographics",
     )
 
-    for attempt in range(max_retries + 1):
-        try:
-            logger.info(
-                f"Parsing demographics (attempt {attempt + 1}): {user_input[:100]}..."
-            )
+    logger.info(f"Successfully parsed demographics: {parsed_data}")
+    return parsed_data
 
-            response = client.responses.parse(
-                model=model,
-                input=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_input},
-                ],
-                text_format=UserDemographics,
-            )
 
-            if response.status == "incomplete":
-                reason = getattr(response, "incomplete_details", {}).get(
-                    "reason", "unknown"
-                )
-                logger.warning(f"Incomplete response: {reason}")
-                if attempt < max_retries:
-                    continue
-                raise ValueError(f"Response incomplete: {reason}")
+@cache
+def create_search_and_rank_prompt() -> str:
+    """Generate the system prompt for a combined search and demographics query."""
+    return f"""{create_system_prompt()}
+Return the values above in the "search" object.
 
-            parsed_data = response.output_parsed
-            if parsed_data is None:
-                raise ValueError("OpenAI returned empty parsed response")
+The user may also describe themselves (the patient). Return that in the "demographics" object:
+- age: The patient's age in years, or null if not mentioned
+- sex: One of male, female, or null if not mentioned
+- race: One of white, black, asian, hispanic, native, other, or null if not mentioned
 
-            # Validate sex
-            if parsed_data.sex and parsed_data.sex.lower() not in ALLOWED_SEX:
-                logger.warning(f"Invalid sex returned: {parsed_data.sex}")
-                if attempt < max_retries:
-                    continue
-                parsed_data.sex = None
+Do NOT infer demographics from the provider description (e.g., "female doctor" is not the patient's sex).
+"""
 
-            # Validate race
-            if parsed_data.race and parsed_data.race.lower() not in ALLOWED_RACE:
-                logger.warning(f"Invalid race returned: {parsed_data.race}")
-                if attempt < max_retries:
-                    continue
-                parsed_data.race = None
 
-            logger.info(f"Successfully parsed demographics: {parsed_data}")
-            return parsed_data
+def _search_and_rank_error(
+    parsed_data: SearchAndRankParams, can_retry: bool
+) -> str | None:
+    error = _search_params_error(parsed_data.search)
+    if error:
+        return error
 
-        except Exception as e:
-            logger.error(f"Parsing attempt {attempt + 1} failed: {str(e)}")
-            if attempt == max_retries:
-                raise ValueError(
-                    f"Failed to parse demographics after {max_retries + 1} attempts: {str(e)}"
-                )
+    # Demographics are optional here, so drop invalid values instead of retrying
+    return _clean_demographics(parsed_data.demographics)
+
+
+def parse_search_and_rank(
+    user_input: str,
+    client: Optional["OpenAI"] = None,
+    model: str = "gpt-4o-mini",
+    max_retries: int = 2,
+) -> SearchAndRankParams:
+    """
+    Parse natural language input to extract search parameters and user
+    demographics in a single structured output call.
+
+    Args:
+        user_input: Natural language query from user
+        client: OpenAI client instance (uses the shared client if None)
+        model: OpenAI model to use
+        max_retries: Number of retry attempts on failure
+
+    Returns:
+        SearchAndRankParams: Structured search parameters and demographics
+
+    Raises:
+        ValueError: If parsing fails after retries
+    """
+    parsed_data = _parse_structured(
+        user_input,
+        create_search_and_rank_prompt(),
+        SearchAndRankParams,
+        _search_and_rank_error,
+        client,
+        model,
+        max_retries,
+        "search and rank query",
+    )
 
-    raise ValueError("Unexpected error in parse_user_demographics")
+    logger.info(f"Successfully parsed search and rank query: {parsed_data}")
+    return parsed_data
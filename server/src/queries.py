@@ -1,52 +1,88 @@
-from sqlalchemy import text, bindparam
-from .db import engine
+from collections.abc import Iterator
+
+from .admission import db_limiter
+from .db import get_engine
 from .models import Provider, ProviderDemographics
+from .partitions import SERVICES_STATE_COLUMN, states_for_zip
 
 
-def search_providers(
+PROVIDER_COLUMNS = """
+            p.rndrng_npi AS id,
+            p.rndrng_prvdr_last_org_name AS last_name,
+            p.rndrng_prvdr_first_name AS first_name,
+            p.rndrng_prvdr_crdntls AS credentials,
+            p.rndrng_prvdr_st1 AS street_1,
+            p.rndrng_prvdr_st2 AS street_2,
+            p.rndrng_prvdr_city AS city,
+            p.rndrng_prvdr_state_abrvtn AS state,
+            p.rndrng_prvdr_zip5 AS zipcode,
+            p.rndrng_prvdr_type AS specialty,
+            p.rndrng_prvdr_mdcr_prtcptg_ind AS accepts_medicare,
+            p.tot_benes AS total_benes,
+            p.bene_avg_age AS avg_age"""
+
+DEMOGRAPHIC_COLUMNS = """
+            p.bene_feml_cnt,
+            p.bene_male_cnt,
+            p.bene_race_wht_cnt,
+            p.bene_race_black_cnt,
+            p.bene_race_api_cnt,
+            p.bene_race_hspnc_cnt,
+            p.bene_race_nat_ind_cnt,
+            p.bene_race_othr_cnt"""
+
+
+def _search_query(
+    columns: str,
     specialty: str,
     hcpcs_prefix: str,
     city: str | None = None,
     state: str | None = None,
     zipcode: str | None = None,
-) -> list[Provider]:
+):
+    """
+    Build the search query, routed to the state partition for the location.
+
+    Returns the query, its params and the engine to run it on.
+    """
+    from sqlalchemy import bindparam, text
+
     if zipcode:
+        # A ZIP missing from the lookup may have been added by an ingest since
+        # it was loaded, so search every partition on the main database
+        states = states_for_zip(zipcode) or None
         location_condition = "p.rndrng_prvdr_zip5 = :zipcode"
         location_params = {"zipcode": zipcode}
     elif city and state:
-        location_condition = (
-            "p.rndrng_prvdr_state_abrvtn = :state AND p.rndrng_prvdr_city = :city"
-        )
-        location_params = {"state": state, "city": city}
+        states = [state]
+        location_condition = "p.rndrng_prvdr_city = :city"
+        location_params = {"city": city}
     else:
         raise ValueError("Must provide either zipcode or both city and state")
 
+    # Filtering on state lets MySQL prune to the state's partition, including
+    # for ZIP-only searches
+    if states:
+        location_condition += " AND p.rndrng_prvdr_state_abrvtn IN :states"
+        if SERVICES_STATE_COLUMN:
+            location_condition += " AND s.rndrng_prvdr_state_abrvtn IN :states"
+        location_params["states"] = states
+
     query = text(
         f"""
-        SELECT 
-            p.rndrng_npi AS id,
-            p.rndrng_prvdr_last_org_name AS last_name,
-            p.rndrng_prvdr_first_name AS first_name,
-            p.rndrng_prvdr_crdntls AS credentials,
-            p.rndrng_prvdr_st1 AS street_1,
-            p.rndrng_prvdr_st2 AS street_2,
-            p.rndrng_prvdr_city AS city,
-            p.rndrng_prvdr_state_abrvtn AS state,
-            p.rndrng_prvdr_zip5 AS zipcode,
-            p.rndrng_prvdr_type AS specialty,
-            p.rndrng_prvdr_mdcr_prtcptg_ind AS accepts_medicare,
-            p.tot_benes AS total_benes,
-            p.bene_avg_age AS avg_age
+        SELECT {columns}
         FROM providers p
         JOIN provider_services s 
             ON p.rndrng_npi = s.rndrng_npi
         WHERE {location_condition}
           AND p.rndrng_prvdr_type = :specialty
           AND s.hcpcs_cd LIKE :hcpcs
-        GROUP BY p.rndrng_npi
+        GROUP BY p.rndrng_npi, p.rndrng_prvdr_state_abrvtn
         LIMIT 10000
         """
     )
+    if states:
+        query = query.bindparams(bindparam("states", expanding=True))
 
     params = {
         **location_params,
@@ -54,16 +90,91 @@ def search_providers(
         "hcpcs": f"{hcpcs_prefix}%",
     }
 
-    with engine.connect() as conn:
-        rows = conn.execute(query, params).mappings().all()
+    engine = get_engine(states[0] if states and len(states) == 1 else None)
+    return query, params, engine
+
+
+def _search_rows(
+    columns: str,
+    specialty: str,
+    hcpcs_prefix: str,
+    city: str | None = None,
+    state: str | None = None,
+    zipcode: str | None = None,
+):
+    query, params, engine = _search_query(
+        columns, specialty, hcpcs_prefix, city, state, zipcode
+    )
 
+    with db_limiter.slot(), engine.connect() as conn:
+        return conn.execute(query, params).mappings().all()
+
+
+def search_providers(
+    specialty: str,
+    hcpcs_prefix: str,
+    city: str | None = None,
+    state: str | None = None,
+    zipcode: str | None = None,
+) -> list[Provider]:
+    rows = _search_rows(PROVIDER_COLUMNS, specialty, hcpcs_prefix, city, state, zipcode)
     return [Provider(**row) for row in rows]
 
 
+def stream_search_providers(
+    specialty: str,
+    hcpcs_prefix: str,
+    city: str | None = None,
+    state: str | None = None,
+    zipcode: str | None = None,
+    chunk_size: int = 250,
+) -> Iterator[list[Provider]]:
+    """
+    Same search as search_providers, but yields results in chunks from a
+    server-side cursor so the full result set is never held in memory.
+
+    The connection is held until the generator is exhausted or closed. It is
+    not taken under db_limiter, since its hold time depends on how fast the
+    client reads; callers should hold a stream_limiter slot instead.
+    """
+    query, params, engine = _search_query(
+        PROVIDER_COLUMNS, specialty, hcpcs_prefix, city, state, zipcode
+    )
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(query, params)
+        for rows in result.mappings().partitions(chunk_size):
+            yield [Provider(**row) for row in rows]
+
+
+def search_provider_demographics(
+    specialty: str,
+    hcpcs_prefix: str,
+    city: str | None = None,
+    state: str | None = None,
+    zipcode: str | None = None,
+) -> list[ProviderDemographics]:
+    """
+    Same search as search_providers, but selects the demographic columns in the
+    same query so results can be scored without a second round trip.
+    """
+    rows = _search_rows(
+        f"{PROVIDER_COLUMNS},{DEMOGRAPHIC_COLUMNS}",
+        specialty,
+        hcpcs_prefix,
+        city,
+        state,
+        zipcode,
+    )
+    return [ProviderDemographics(**row) for row in rows]
+
+
 def get_provider_demographics(provider_ids: list[int]) -> list[ProviderDemographics]:
     if not provider_ids:
         return []
 
+    from sqlalchemy import bindparam, text
+
     query = text(
         """
         SELECT
@@ -99,7 +210,118 @@ def get_provider_demographics(provider_ids: list[int]) -> list[ProviderDemograph
         """
     ).bindparams(bindparam("provider_ids", expanding=True))
 
-    with engine.connect() as conn:
+    with db_limiter.slot(), get_engine().connect() as conn:
         rows = conn.execute(query, {"provider_ids": provider_ids}).mappings().all()
 
     return [ProviderDemographics(**row) for row in rows]
+
+
+def get_specialty_counts() -> dict[str, int]:
+    from sqlalchemy import text
+
+    query = text(
+        """
+        SELECT rndrng_prvdr_type AS specialty, COUNT(*) AS count
+        FROM providers
+        GROUP BY rndrng_prvdr_type
+        """
+    )
+
+    with db_limiter.slot(), get_engine().connect() as conn:
+        rows = conn.execute(query).mappings().all()
+
+    return {row["specialty"]: row["count"] for row in rows}
+
+
+def get_location_counts() -> list[dict]:
+    from sqlalchemy import text
+
+    query = text(
+        """
+        SELECT
+            rndrng_prvdr_city AS city,
+            rndrng_prvdr_state_abrvtn AS state,
+            rndrng_prvdr_zip5 AS zipcode,
+            COUNT(*) AS count
+        FROM providers
+        GROUP BY rndrng_prvdr_city, rndrng_prvdr_state_abrvtn, rndrng_prvdr_zip5
+        """
+    )
+
+    with db_limiter.slot(), get_engine().connect() as conn:
+        rows = conn.execute(query).mappings().all()
+
+    return [dict(row) for row in rows]
+
+
+def get_data_version() -> str | None:
+    """
+    Identify the currently loaded CMS data by the version the ingest writes
+    to the data_version table.
+    """
+    from sqlalchemy import text
+
+    query = text(
+        """
+        SELECT version
+        FROM data_version
+        ORDER BY updated_at DESC
+        LIMIT 1
+        """
+    )
+
+    with db_limiter.slot(), get_engine().connect() as conn:
+        return conn.execute(query).scalar()
+
+
+def get_zip_states() -> list[tuple[str, str]]:
+    from sqlalchemy import text
+
+    query = text(
+        """
+        SELECT DISTINCT rndrng_prvdr_zip5, rndrng_prvdr_state_abrvtn
+        FROM providers
+        """
+    )
+
+    with db_limiter.slot(), get_engine().connect() as conn:
+        rows = conn.execute(query).all()
+
+    return [(zipcode, state) for zipcode, state in rows]
+
+
+def insert_query_parses(records: list[dict]) -> None:
+    """
+    Insert recorded parses. Runs from a background writer, so it doesn't take
+    a db_limiter slot from searches.
+    """
+    from sqlalchemy import text
+
+    query = text(
+        """
+        INSERT INTO query_parses
+            (query, specialty, hcpcs_prefix, zipcode, city, state, confidence)
+        VALUES
+            (:query, :specialty, :hcpcs_prefix, :zipcode, :city, :state, :confidence)
+        """
+    )
+
+    with get_engine().begin() as conn:
+        conn.execute(query, records)
+
+
+def get_query_parses() -> list[dict]:
+    from sqlalchemy import text
+
+    query = text(
+        """
+        SELECT query, specialty, hcpcs_prefix, zipcode, city, state, confidence
+        FROM query_parses
+        ORDER BY id
+        """
+    )
+
+    with get_engine().connect() as conn:
+        rows = conn.execute(query).mappings().all()
+
+    return [dict(row) for row in rows]
@@ -1,13 +1,32 @@
+from collections.abc import Iterator
+import heapq
+import itertools
+import json
+
+from .admission import OverloadedError, stream_limiter
+from .classifier import parse_query_locally, record_parse
 from .models import (
     NLSResponse,
     ProviderDemographics,
+    ProviderSearchParams,
     RankedProvidersResponse,
+    SearchAndRankResponse,
     UserDemographics,
     ScoredProvider,
 )
-from .queries import get_provider_demographics, search_providers
-from .prompt import parse_provider_query, parse_user_demographics
-from .constants import HCPCS_MAPPINGS
+from .queries import (
+    get_provider_demographics,
+    search_provider_demographics,
+    search_providers,
+    stream_search_providers,
+)
+from .prompt import (
+    parse_provider_query,
+    parse_search_and_rank,
+    parse_user_demographics,
+)
+from .constants import HCPCS_MAPPINGS, MEDICARE_SPECIALTIES
+from .startup import record_first_search
 
 
 def natural_language_search(user_query: str) -> NLSResponse:
@@ -21,18 +40,76 @@ def natural_language_search(user_query: str) -> NLSResponse:
         Dictionary containing parsed parameters and search results
     """
     try:
-        # Parse the natural language query
-        params = parse_provider_query(user_query)
+        params, parsed_by_llm = resolve_search_params(user_query)
 
-        # Validate that we have all required parameters
-        missing_params = []
-        if not params.specialty:
-            missing_params.append("specialty")
-        if not params.zipcode and not (params.city and params.state):
-            missing_params.append("location (zipcode or city and state)")
-        if not params.hcpcs_prefix:
-            missing_params.append("procedure/service type")
+        res = search_with_params(params)
+        if parsed_by_llm and res.success:
+            record_parse(user_query, params)
+
+        return res
+
+    except OverloadedError:
+        raise
+    except Exception:
+        return NLSResponse(
+            success=False,
+            parsed_params={},
+            results=[],
+            error="Internal error. Please try again",
+        )
 
+
+def resolve_search_params(user_query: str) -> tuple[ProviderSearchParams, bool]:
+    """
+    Parse the natural language query, locally if the model is confident.
+
+    Returns:
+        The search parameters, and whether the LLM was used to parse them
+    """
+    params = parse_query_locally(user_query)
+    if params is not None:
+        return params, False
+    return parse_provider_query(user_query), True
+
+
+def missing_search_params(
+    params: ProviderSearchParams, strict: bool = False
+) -> list[str]:
+    """
+    List the search parameters that are missing. With strict, specialty and
+    hcpcs_prefix must also be known values, for parameters that didn't come
+    from the parser.
+    """
+    missing_params = []
+    if not params.specialty or (
+        strict and params.specialty not in MEDICARE_SPECIALTIES
+    ):
+        missing_params.append("specialty")
+    if not params.zipcode and not (params.city and params.state):
+        missing_params.append("location (zipcode or city and state)")
+    if not params.hcpcs_prefix or (
+        strict and params.hcpcs_prefix not in HCPCS_MAPPINGS
+    ):
+        missing_params.append("procedure/service type")
+    return missing_params
+
+
+def search_with_params(
+    params: ProviderSearchParams, strict: bool = False
+) -> NLSResponse:
+    """
+    Search for providers using already resolved search parameters.
+
+    Args:
+        params: Search parameters, parsed from a query or given directly
+        strict: Also reject unknown specialty and hcpcs_prefix values
+
+    Returns:
+        Dictionary containing the parameters and search results
+    """
+    try:
+        # Validate that we have all required parameters
+        missing_params = missing_search_params(params, strict)
         if missing_params:
             return NLSResponse(
                 success=False,
@@ -57,6 +134,8 @@ def natural_language_search(user_query: str) -> NLSResponse:
             count=len(results),
         )
 
+    except OverloadedError:
+        raise
     except Exception:
         return NLSResponse(
             success=False,
@@ -66,6 +145,92 @@ def natural_language_search(user_query: str) -> NLSResponse:
         )
 
 
+def format_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_natural_language_search(user_query: str) -> Iterator[str]:
+    """
+    Search for providers using natural language, streaming the response as
+    Server-Sent Events.
+
+    The query is parsed and a stream slot taken before the stream starts, so
+    an overloaded LLM or database is still reported as an HTTP error. The
+    stream then emits:
+        params:  {"parsed_params": {...}, "hcpcs_desc": "..."}
+        results: {"results": [...]}, once per chunk of rows
+        done:    {"count": n}
+        error:   {"error": "..."}, in place of the remaining events on failure
+
+    Args:
+        user_query: Natural language query from the user
+
+    Returns:
+        Iterator of formatted events
+    """
+    try:
+        params, parsed_by_llm = resolve_search_params(user_query)
+    except OverloadedError:
+        raise
+    except Exception:
+        return iter(
+            [format_event("error", {"error": "Internal error. Please try again"})]
+        )
+
+    params_event = format_event(
+        "params",
+        {
+            "parsed_params": params.model_dump(),
+            "hcpcs_desc": HCPCS_MAPPINGS.get(params.hcpcs_prefix),
+        },
+    )
+
+    missing_params = missing_search_params(params)
+    if missing_params:
+        error = f"Could not determine: {', '.join(missing_params)}. Please provide more details."
+        return iter([params_event, format_event("error", {"error": error})])
+
+    def events() -> Iterator[str]:
+        # Streams hold their connection while the client reads, so they use
+        # their own limiter rather than counting network time as DB time
+        with stream_limiter.slot():
+            yield params_event
+
+            try:
+                count = 0
+                for chunk in stream_search_providers(
+                    specialty=params.specialty,
+                    hcpcs_prefix=params.hcpcs_prefix,
+                    city=params.city,
+                    state=params.state,
+                    zipcode=params.zipcode,
+                ):
+                    count += len(chunk)
+                    yield format_event(
+                        "results", {"results": [p.model_dump() for p in chunk]}
+                    )
+
+                yield format_event("done", {"count": count})
+                record_first_search()
+
+            except Exception:
+                yield format_event(
+                    "error", {"error": "Internal error. Please try again"}
+                )
+                return
+
+        if parsed_by_llm:
+            record_parse(user_query, params)
+
+    # Start the generator here so the stream slot is taken, and an overload
+    # raised as an HTTP error, before the response starts. Once started,
+    # closing the generator (e.g. on client disconnect) releases the slot.
+    stream = events()
+    first_event = next(stream)
+    return itertools.chain([first_event], stream)
+
+
 def rank_providers_nl(user_input: str, providers: list[int]) -> RankedProvidersResponse:
     """
     Main function to rank providers based on natural language input.
@@ -91,24 +256,7 @@ def rank_providers_nl(user_input: str, providers: list[int]) -> RankedProvidersR
             )
 
         provider_demographics = get_provider_demographics(providers)
-        score_results: list[ScoredProvider] = []
-
-        for prov in provider_demographics:
-            score = compute_score(prov, user_demographics)
-            scored = ScoredProvider(**prov.model_dump(), score=score)
-            score_results.append(scored)
-
-        score_results.sort(key=lambda p: p.score, reverse=True)
-
-        # Normalize so top is 100
-        top_score = score_results[0].score if score_results else 0
-        if top_score > 0:
-            for p in score_results:
-                p.score = (p.score / top_score) * 100
-
-        score_results.sort(key=lambda p: p.score, reverse=True)
-        for i, p in enumerate(score_results):
-            p.rank = i + 1
+        score_results = score_providers(provider_demographics, user_demographics)
 
         return RankedProvidersResponse(
             success=True,
@@ -116,6 +264,8 @@ def rank_providers_nl(user_input: str, providers: list[int]) -> RankedProvidersR
             results=score_results,
         )
 
+    except OverloadedError:
+        raise
     except Exception:
         return RankedProvidersResponse(
             success=False,
@@ -125,6 +275,99 @@ def rank_providers_nl(user_input: str, providers: list[int]) -> RankedProvidersR
         )
 
 
+def search_and_rank_nl(user_query: str, top_k: int = 100) -> SearchAndRankResponse:
+    """
+    Search for providers and rank them against the user's demographics using a
+    single LLM call and a single database query.
+
+    Args:
+        user_query: Natural language query describing the search and the user
+        top_k: Maximum number of ranked providers to return
+
+    Returns:
+        Dictionary containing parsed parameters and the top ranked providers
+    """
+    try:
+        parsed = parse_search_and_rank(user_query)
+        params = parsed.search
+        user_demographics = parsed.demographics
+        parsed_params = {**params.model_dump(), **user_demographics.model_dump()}
+
+        missing_params = missing_search_params(params)
+        if not any(
+            [user_demographics.age, user_demographics.sex, user_demographics.race]
+        ):
+            missing_params.append("age, sex, or race")
+
+        if missing_params:
+            return SearchAndRankResponse(
+                success=False,
+                parsed_params=parsed_params,
+                results=[],
+                error=f"Could not determine: {', '.join(missing_params)}. Please provide more details.",
+            )
+
+        # Combined queries aren't recorded for the local model: they include the
+        # patient's demographics, which shouldn't be stored or used as features
+        providers = search_provider_demographics(
+            specialty=params.specialty,
+            hcpcs_prefix=params.hcpcs_prefix,
+            city=params.city,
+            state=params.state,
+            zipcode=params.zipcode,
+        )
+
+        return SearchAndRankResponse(
+            success=True,
+            parsed_params=parsed_params,
+            results=score_providers(providers, user_demographics, top_k),
+            hcpcs_desc=HCPCS_MAPPINGS.get(params.hcpcs_prefix),
+            count=len(providers),
+        )
+
+    except OverloadedError:
+        raise
+    except Exception:
+        return SearchAndRankResponse(
+            success=False,
+            parsed_params={},
+            results=[],
+            error="Internal error. Please try again",
+        )
+
+
+def score_providers(
+    providers: list[ProviderDemographics],
+    user: UserDemographics,
+    top_k: int | None = None,
+) -> list[ScoredProvider]:
+    """
+    Score providers against the user's demographics and return them ranked,
+    normalized so the top score is 100. If top_k is given only the best top_k
+    providers are returned.
+    """
+    score_results = [
+        ScoredProvider(**prov.model_dump(), score=compute_score(prov, user))
+        for prov in providers
+    ]
+
+    if top_k is not None:
+        score_results = heapq.nlargest(top_k, score_results, key=lambda p: p.score)
+    else:
+        score_results.sort(key=lambda p: p.score, reverse=True)
+
+    # Normalize so top is 100
+    top_score = score_results[0].score if score_results else 0
+    if top_score > 0:
+        for p in score_results:
+            p.score = (p.score / top_score) * 100
+
+    for i, p in enumerate(score_results):
+        p.rank = i + 1
+
+    return score_results
+
+
 def compute_score(provider: ProviderDemographics, user: UserDemographics):
     sex_score = 0
     age_score = 0
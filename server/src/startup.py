@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Captured as early as possible so the profile reflects the whole cold start
+PROCESS_START = time.perf_counter()
+
+RETRY_DELAY_SECONDS = 5
+# The OpenAI handshake is attempted once before ready, so an outage can't hold it
+LLM_CONNECT_TIMEOUT_SECONDS = 5
+
+ready = threading.Event()
+profile: dict[str, float] = {}
+# Status of each warmup step: "pending", "ok" or "failed"
+steps: dict[str, str] = {}
+_profile_lock = threading.Lock()
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def record(name: str, start: float) -> None:
+    """Record the milliseconds elapsed since start under name in the profile."""
+    with _profile_lock:
+        profile[name] = _elapsed_ms(start)
+
+
+def record_first_search() -> None:
+    """Record time from process start to the first successful search, once."""
+    with _profile_lock:
+        if "time_to_first_search_ms" not in profile:
+            profile["time_to_first_search_ms"] = _elapsed_ms(PROCESS_START)
+
+
+def get_profile() -> dict[str, float]:
+    with _profile_lock:
+        return dict(profile)
+
+
+def get_steps() -> dict[str, str]:
+    with _profile_lock:
+        return dict(steps)
+
+
+def _set_step(name: str, status: str) -> None:
+    with _profile_lock:
+        steps[name] = status
+
+
+def warm_db() -> None:
+    """Import the DB stack and open a pooled connection."""
+    start = time.perf_counter()
+    from sqlalchemy import text
+    from .db import get_engine
+
+    engine = get_engine()
+    record("import_db_ms", start)
+
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    record("db_connect_ms", start)
+
+    from .http_cache import get_data_version
+
+    get_data_version()
+
+
+def warm_llm() -> None:
+    """Import openai and build the client and prompts."""
+    start = time.perf_counter()
+    from .prompt import create_search_and_rank_prompt, create_system_prompt, get_client
+
+    get_client()
+    record("import_llm_ms", start)
+
+    start = time.perf_counter()
+    create_system_prompt()
+    create_search_and_rank_prompt()
+    record("build_prompts_ms", start)
+
+
+def warm_llm_connection() -> None:
+    """Open a connection to the OpenAI API."""
+    from .prompt import get_client
+
+    # Any cheap authenticated call completes the TLS handshake for the pool.
+    # with_options shares the client's connection pool
+    start = time.perf_counter()
+    get_client().with_options(
+        timeout=LLM_CONNECT_TIMEOUT_SECONDS, max_retries=0
+    ).models.list()
+    record("llm_connect_ms", start)
+
+
+def warm_local_model() -> None:
+    """Load the local query classifier, if one has been trained."""
+    start = time.perf_counter()
+    from .classifier import get_classifier
+
+    get_classifier()
+    record("load_local_model_ms", start)
+
+
+def warm_typeahead() -> None:
+    """Rebuild the typeahead index with provider locations and counts."""
+    start = time.perf_counter()
+    from .typeahead import load_index
+
+    load_index()
+    record("load_typeahead_ms", start)
+
+
+def warm_partitions() -> None:
+    """Load the ZIP to state lookup used to route searches to a partition."""
+    start = time.perf_counter()
+    from .partitions import load_zip_states
+
+    load_zip_states()
+    record("load_zip_states_ms", start)
+
+
+# The instance can't serve searches until these succeed
+REQUIRED_STEPS = [warm_db, warm_llm]
+# Tried once before ready, so the first requests don't pay the handshake
+PRE_READY_STEPS = [warm_llm_connection]
+# These only make serving faster, so a failure is logged and skipped. The
+# typeahead build is CPU-bound, so it runs last
+OPTIONAL_STEPS = [warm_partitions, warm_local_model, warm_typeahead]
+
+
+def _run_step(step) -> bool:
+    try:
+        step()
+    except Exception as e:
+        logger.warning(f"Warmup step {step.__name__} failed: {str(e)}")
+        _set_step(step.__name__, "failed")
+        return False
+    _set_step(step.__name__, "ok")
+    return True
+
+
+def warmup() -> None:
+    """
+    Warm the DB pool and LLM client, retrying until both succeed, and try the
+    OpenAI connection once, then mark the instance ready. The optional steps
+    run once afterwards, best-effort.
+    """
+    start = time.perf_counter()
+    for step in REQUIRED_STEPS + PRE_READY_STEPS + OPTIONAL_STEPS:
+        _set_step(step.__name__, "pending")
+
+    pending = list(REQUIRED_STEPS)
+    while pending:
+        pending = [step for step in pending if not _run_step(step)]
+        if pending:
+            time.sleep(RETRY_DELAY_SECONDS)
+
+    for step in PRE_READY_STEPS:
+        _run_step(step)
+
+    record("time_to_ready_ms", PROCESS_START)
+    ready.set()
+    logger.info(f"Instance ready: {get_profile()}")
+
+    for step in OPTIONAL_STEPS:
+        _run_step(step)
+
+    record("warmup_ms", start)
+    logger.info(f"Warmup finished: {get_steps()}")
+
+
+def start_warmup() -> threading.Thread:
+    """Run warmup in a background thread so the server can accept health checks."""
+    record("time_to_startup_ms", PROCESS_START)
+    thread = threading.Thread(target=warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,194 @@
+"""
+In-memory typeahead over specialties, procedure groups and provider locations.
+
+Suggestions are stored in prefix tries where every node keeps its own top
+suggestions, so a lookup is a walk down the trie with no sorting or scanning.
+Each group of suggestion types has its own trie, so procedure groups (which
+have no counts) aren't crowded out by high count locations.
+"""
+
+import logging
+import re
+
+from .constants import HCPCS_MAPPINGS, MEDICARE_SPECIALTIES
+from .models import Suggestion
+
+logger = logging.getLogger(__name__)
+
+# Suggestions kept per trie node, which caps the limit a lookup can ask for
+MAX_SUGGESTIONS = 10
+# Trailing words of the query considered when looking for a match
+MAX_PREFIX_WORDS = 3
+# Suggestion types indexed together, each group reserves slots in a lookup
+TYPE_GROUPS = {
+    "specialty": "specialty",
+    "procedure": "procedure",
+    "city": "location",
+    "state": "location",
+    "zipcode": "location",
+}
+# Slots each matching group is guaranteed before the rest are filled by count
+RESERVED_PER_GROUP = 2
+
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+", re.IGNORECASE | re.ASCII)
+
+
+def normalize(text: str) -> str:
+    return " ".join(word.lower() for word in WORD_PATTERN.findall(text))
+
+
+class _Node:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children: dict[str, _Node] = {}
+        self.top: list[Suggestion] = []
+
+
+class Trie:
+    """
+    Prefix trie that returns the highest count suggestions for a prefix.
+
+    Each suggestion is indexed from the start of every word in its label, so
+    "surg" matches "Orthopedic surgery" as well as "Surgical oncology".
+    """
+
+    def __init__(self, suggestions: list[Suggestion]):
+        self.root = _Node()
+
+        # Inserting in descending count order means the first MAX_SUGGESTIONS
+        # to reach a node are its top suggestions
+        for suggestion in sorted(suggestions, key=lambda s: (-s.count, s.label)):
+            words = normalize(suggestion.label).split()
+            for i in range(len(words)):
+                self._insert(" ".join(words[i:]), suggestion)
+
+    def _insert(self, key: str, suggestion: Suggestion) -> None:
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, _Node())
+            if len(node.top) < MAX_SUGGESTIONS and suggestion not in node.top:
+                node.top.append(suggestion)
+
+    def lookup(self, prefix: str) -> list[Suggestion]:
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.top
+
+
+def build_suggestions(
+    specialty_counts: dict[str, int] | None = None,
+    location_counts: list[dict] | None = None,
+) -> list[Suggestion]:
+    """
+    Build the suggestion list from the constants, plus provider counts and
+    locations from the database when they are available.
+    """
+    # The providers table doesn't use the same casing as MEDICARE_SPECIALTIES
+    counts_by_name: dict[str, int] = {}
+    for name, count in (specialty_counts or {}).items():
+        if name:
+            counts_by_name[name.lower()] = counts_by_name.get(name.lower(), 0) + count
+
+    suggestions = [
+        Suggestion(
+            type="specialty",
+            label=specialty,
+            count=counts_by_name.get(specialty.lower(), 0),
+        )
+        for specialty in MEDICARE_SPECIALTIES
+    ]
+
+    # Drop the code range from the description, e.g. "Diagnostic Ultrasound (76506-76999)"
+    suggestions += [
+        Suggestion(type="procedure", label=re.sub(r"\s*\(.*\)$", "", desc), count=0)
+        for desc in HCPCS_MAPPINGS.values()
+    ]
+
+    city_counts: dict[str, int] = {}
+    state_counts: dict[str, int] = {}
+    zip_counts: dict[str, int] = {}
+    for row in location_counts or []:
+        city = f"{row['city'].title()}, {row['state']}"
+        city_counts[city] = city_counts.get(city, 0) + row["count"]
+        state_counts[row["state"]] = state_counts.get(row["state"], 0) + row["count"]
+        zip_counts[row["zipcode"]] = zip_counts.get(row["zipcode"], 0) + row["count"]
+
+    for kind, counts in (
+        ("city", city_counts),
+        ("state", state_counts),
+        ("zipcode", zip_counts),
+    ):
+        suggestions += [
+            Suggestion(type=kind, label=label, count=count)
+            for label, count in counts.items()
+        ]
+
+    return suggestions
+
+
+def build_tries(suggestions: list[Suggestion]) -> dict[str, Trie]:
+    grouped: dict[str, list[Suggestion]] = {}
+    for suggestion in suggestions:
+        grouped.setdefault(TYPE_GROUPS[suggestion.type], []).append(suggestion)
+    return {group: Trie(members) for group, members in grouped.items()}
+
+
+_tries = build_tries(build_suggestions())
+
+
+def load_index() -> None:
+    """
+    Rebuild the tries with provider counts and locations from the database.
+    Until this runs, suggestions only cover specialties and procedures.
+    """
+    from .queries import get_location_counts, get_specialty_counts
+
+    global _tries
+    # Swapped in whole, so concurrent lookups see either the old or new tries
+    _tries = build_tries(
+        build_suggestions(get_specialty_counts(), get_location_counts())
+    )
+    logger.info("Typeahead index loaded")
+
+
+def merge_groups(results: list[list[Suggestion]], limit: int) -> list[Suggestion]:
+    """
+    Merge per-group results, each already in descending count order. Every
+    group gets up to RESERVED_PER_GROUP slots, and the rest go by count.
+    """
+    reserved = min(RESERVED_PER_GROUP, limit // max(len(results), 1))
+    chosen = [s for group in results for s in group[:reserved]]
+    rest = sorted(
+        (s for group in results for s in group[reserved:]),
+        key=lambda s: (-s.count, s.label),
+    )
+    chosen += rest[: limit - len(chosen)]
+    return sorted(chosen, key=lambda s: (-s.count, s.label))[:limit]
+
+
+def suggest(
+    query: str, limit: int = MAX_SUGGESTIONS
+) -> tuple[str, int, list[Suggestion]]:
+    """
+    Suggest completions for the end of the query.
+
+    Tries the longest run of trailing words first, so "knee surgeon in san ant"
+    completes "san ant" rather than just "ant". Returns the matched part of the
+    normalized query, the index in query where that part starts, and the
+    suggestions.
+    """
+    matches = list(WORD_PATTERN.finditer(query))[-MAX_PREFIX_WORDS:]
+    tries = _tries
+
+    for i in range(len(matches)):
+        prefix = " ".join(match.group().lower() for match in matches[i:])
+        results = [r for r in (t.lookup(prefix) for t in tries.values()) if r]
+        if results:
+            return prefix, matches[i].start(), merge_groups(results, limit)
+
+    return "", len(query), []
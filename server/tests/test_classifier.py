@@ -0,0 +1,57 @@
+import unittest
+
+from src.classifier import QueryClassifier, extract_location, parse_query_locally
+
+
+class ExtractLocationTest(unittest.TestCase):
+    def test_zipcode_after_location_word(self):
+        self.assertEqual(
+            extract_location("dermatologist near 78701"),
+            {"zipcode": "78701", "city": None, "state": None},
+        )
+
+    def test_city_and_state(self):
+        self.assertEqual(
+            extract_location("knee surgeon in San Antonio, TX"),
+            {"zipcode": None, "city": "San Antonio", "state": "TX"},
+        )
+
+    def test_procedure_code_is_not_a_zipcode(self):
+        self.assertIsNone(
+            extract_location("cardiologist who can do 93306 echo in Chicago IL")
+        )
+        self.assertIsNone(extract_location("knee replacement 27447 near Austin TX"))
+        self.assertIsNone(extract_location("echo 93306 in 60601"))
+
+    def test_zipcode_and_city_is_ambiguous(self):
+        self.assertIsNone(extract_location("cardiologist in 60601 in Chicago IL"))
+
+
+class ParseQueryLocallyTest(unittest.TestCase):
+    def setUp(self):
+        examples = [
+            {"query": query, "specialty": "Cardiology", "hcpcs_prefix": "93"}
+            for query in (
+                "cardiologist echo",
+                "heart doctor echo",
+                "cardiology echocardiogram",
+            )
+        ]
+        self.model = QueryClassifier().fit(examples)
+
+    def test_falls_back_to_llm_with_procedure_code(self):
+        query = "cardiologist who can do 93306 echo in Chicago IL"
+        self.assertIsNone(parse_query_locally(query, self.model, threshold=0.0))
+
+    def test_parses_city_and_state(self):
+        params = parse_query_locally(
+            "cardiologist echo in Chicago IL", self.model, threshold=0.0
+        )
+        self.assertEqual(
+            (params.specialty, params.city, params.state),
+            ("Cardiology", "Chicago", "IL"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()